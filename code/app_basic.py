@@ -5,6 +5,7 @@ from langchain_community.embeddings import OpenAIEmbeddings
 from ensemble import create_ensemble_retriever
 from full_chain import create_full_chain, ask_question
 from data_loader import *
+from vector_store import EMBEDDING_MODEL
 from streamlit_option_menu import option_menu
 
 st.set_page_config(page_title="All knowing Credit Risk Manager")
@@ -59,7 +60,7 @@ def save_uploaded_file(uploaded_file):
 @st.cache_resource
 def get_retriever(openai_api_key=None):
     docs = load_files("./data")
-    embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key, model="text-embedding-3-small")
+    embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key, model=EMBEDDING_MODEL)
     return create_ensemble_retriever(docs, embeddings=embeddings)
 
 
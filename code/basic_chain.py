@@ -8,12 +8,20 @@ from langchain_community.chat_models.huggingface import ChatHuggingFace
 
 from dotenv import load_dotenv
 
+from llm_cache import with_completion_cache
+
 MISTRAL_ID = "mistralai/Mistral-7B-Instruct-v0.3"
 ZEPHYR_ID = "HuggingFaceH4/zephyr-7b-beta"
 # LLAMA_ID = "meta-llama/Meta-Llama-3-8B"
 # ZEPHYR_ID_2 = "HuggingFaceH4/zephyr-orpo-141b-A35b-v0.1"
 
-def get_model(repo_id=MISTRAL_ID, **kwargs):
+def get_model(repo_id=MISTRAL_ID, cache_path=None, **kwargs):
+    """
+    Chat model for the given repo id ("ChatGPT" for OpenAI).
+
+    Completions are cached in SQLite when `cache_path` (or the LLM_CACHE_PATH
+    environment variable) is set, so repeated identical prompts skip the API call.
+    """
     if repo_id == "ChatGPT":
         chat_model = ChatOpenAI(temperature=0, **kwargs)
     else:
@@ -33,4 +41,4 @@ def get_model(repo_id=MISTRAL_ID, **kwargs):
                 "huggingfacehub_api_token": huggingfacehub_api_token,
             })
         chat_model = ChatHuggingFace(llm=llm)
-    return chat_model
\ No newline at end of file
+    return with_completion_cache(chat_model, cache_path)
\ No newline at end of file
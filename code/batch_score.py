@@ -0,0 +1,208 @@
+"""
+Headless batch scoring of loan applications through the full chain.
+
+Reads applications from a CSV one row at a time, runs each through
+`create_full_chain` with its own chat history, and appends one JSON line per
+application to the output file. Re-running with the same output file resumes
+where the previous run stopped; failed applications are retried.
+
+    python batch_score.py applications.csv --output results.jsonl --concurrency 16
+    python batch_score.py applications.csv --fake   # no API calls
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from langchain.memory import ChatMessageHistory
+
+from data_loader import load_files
+from ensemble import create_ensemble_retriever, create_workflow_retriever
+from full_chain import create_full_chain
+from llm_cache import get_completion_cache, with_completion_cache
+from vector_store import EMBEDDING_MODEL, create_fake_embeddings
+
+DEFAULT_QUESTION = "Please evaluate the following loan application and say whether it should be approved and why.\n\n{application}"
+PROGRESS_EVERY = 100
+
+
+def read_applications(csv_path, id_column=None):
+    """Yield (application_id, row) pairs without loading the whole file."""
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=1):
+            app_id = row.get(id_column) if id_column else None
+            # the fallback must not collide with a real id
+            yield str(app_id) if app_id else f"row-{line_no}", row
+
+
+def format_application(row, question=DEFAULT_QUESTION):
+    application = "\n".join(f"{key}: {value}" for key, value in row.items())
+    return question.format(application=application)
+
+
+def load_completed(output_path):
+    """Ids of applications already scored successfully in a previous run."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # a partially written last line from an interrupted run
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["id"])
+    return completed
+
+
+class BatchStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.ok = 0
+        self.failed = 0
+        self.skipped = 0
+
+    @property
+    def processed(self):
+        return self.ok + self.failed
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        per_minute = self.processed / elapsed * 60 if elapsed else 0.0
+        failure_rate = self.failed / self.processed if self.processed else 0.0
+        return (f"{self.processed} scored ({self.ok} ok, {self.failed} failed, {self.skipped} skipped) "
+                f"in {elapsed:.1f}s, {per_minute:.1f} applications/min, failure rate {failure_rate:.1%}")
+
+
+class BatchScorer:
+    """Runs applications through one shared chain, giving each its own session history."""
+
+    def __init__(self, chain, concurrency=8, question=DEFAULT_QUESTION):
+        self.chain = chain
+        self.concurrency = concurrency
+        self.question = question
+        self.sessions = {}
+
+    def get_session_history(self, session_id):
+        if session_id not in self.sessions:
+            self.sessions[session_id] = ChatMessageHistory()
+        return self.sessions[session_id]
+
+    async def score_one(self, app_id, row):
+        start = time.monotonic()
+        try:
+            response = await self.chain.ainvoke(
+                {"question": format_application(row, self.question)},
+                config={"configurable": {"session_id": app_id}}
+            )
+            record = {"id": app_id, "status": "ok", "response": response.content}
+        except Exception as e:
+            logging.error(f"Error scoring application {app_id}: {e}")
+            record = {"id": app_id, "status": "error", "error": str(e)}
+        finally:
+            self.sessions.pop(app_id, None)
+        record["latency_s"] = round(time.monotonic() - start, 3)
+        return record
+
+    async def run(self, applications, output_path, completed=()):
+        """Score `applications`, appending results to `output_path` as they finish."""
+        stats = BatchStats()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending = set()
+
+        with open(output_path, "a", encoding="utf-8") as out:
+            def write(task):
+                record = task.result()
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                if record["status"] == "ok":
+                    stats.ok += 1
+                else:
+                    stats.failed += 1
+                if stats.processed % PROGRESS_EVERY == 0:
+                    print(stats.summary())
+
+            for app_id, row in applications:
+                if app_id in completed:
+                    stats.skipped += 1
+                    continue
+                # only read the next row once there is room for it
+                await semaphore.acquire()
+                task = asyncio.create_task(self.score_one(app_id, row))
+                task.add_done_callback(lambda _: semaphore.release())
+                pending.add(task)
+                finished = {t for t in pending if t.done()}
+                for t in finished:
+                    write(t)
+                pending -= finished
+
+            if pending:
+                await asyncio.wait(pending)
+                for t in pending:
+                    write(t)
+
+        return stats
+
+
+def export_parquet(output_path, parquet_path):
+    """Write the results to Parquet, keeping only the latest attempt of each application."""
+    import pandas as pd
+    results = pd.read_json(output_path, lines=True, dtype={"id": str})
+    results.drop_duplicates(subset="id", keep="last").to_parquet(parquet_path, index=False)
+
+
+def create_batch_chain(data_dir, workflow=None, fake=False, get_session_history=None):
+    docs = load_files(data_dir)
+    persist_directory = None
+    if fake:
+        from langchain_community.chat_models.fake import FakeListChatModel
+        embeddings, persist_directory = create_fake_embeddings()
+        model = with_completion_cache(
+            FakeListChatModel(responses=["Approve: the applicant meets the credit criteria."]))
+    else:
+        from langchain_openai import OpenAIEmbeddings
+        embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+        model = None
+    retriever = create_workflow_retriever(create_ensemble_retriever(docs, embeddings=embeddings,
+                                                                   persist_directory=persist_directory), workflow)
+    return create_full_chain(retriever, model=model, get_session_history=get_session_history)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a CSV of loan applications through the full chain.")
+    parser.add_argument("applications", help="CSV file with one application per row")
+    parser.add_argument("--output", default="results.jsonl", help="JSONL results file, also used to resume")
+    parser.add_argument("--parquet", help="also write the results to this Parquet file when done")
+    parser.add_argument("--data-dir", default="./data", help="directory with the reference documents")
+    parser.add_argument("--id-column", help="CSV column identifying an application (default: row number)")
+    parser.add_argument("--workflow", help="prefer documents tagged for a workflow, e.g. 'Loan Approval Prediction'")
+    parser.add_argument("--concurrency", type=int, default=8, help="applications scored at the same time")
+    parser.add_argument("--fake", action="store_true", help="use a fake model and embeddings (no API calls)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    scorer = BatchScorer(chain=None, concurrency=args.concurrency)
+    scorer.chain = create_batch_chain(args.data_dir, workflow=args.workflow, fake=args.fake,
+                                      get_session_history=scorer.get_session_history)
+
+    completed = load_completed(args.output)
+    if completed:
+        print(f"Resuming: {len(completed)} applications already scored in {args.output}")
+    applications = read_applications(args.applications, id_column=args.id_column)
+    stats = asyncio.run(scorer.run(applications, args.output, completed=completed))
+    print(stats.summary())
+    if os.environ.get("LLM_CACHE_PATH"):
+        print(f"LLM cache: {get_completion_cache(os.environ['LLM_CACHE_PATH']).stats()}")
+
+    if args.parquet:
+        export_parquet(args.output, args.parquet)
+
+
+if __name__ == "__main__":
+    main()
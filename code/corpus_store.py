@@ -0,0 +1,175 @@
+"""
+Process-wide, read-only corpus storage.
+
+All texts of a corpus live in one UTF-8 arena with an offsets array, and
+identical metadata dicts are stored once. A chunk is only decoded into a
+`Document` when it is actually needed, i.e. for the top-k hits of a query.
+
+Corpora are registered by version (a fingerprint of their files), so every
+Streamlit session can reference the same store by keeping only the version
+string in its session state. The page store is only needed to build a
+retriever, which keeps its chunks in an arena of its own; release it with
+`release_corpus` once the retriever exists so a corpus is held once.
+"""
+import hashlib
+import os
+import sys
+import threading
+from array import array
+
+from langchain.docstore.document import Document
+
+# Only the most recently registered corpora are kept; sessions still pointing
+# at an evicted version reload the current directory.
+MAX_CORPORA = 2
+MAX_SIGNATURES = 16
+
+_corpora = {}
+_signatures = {}
+_registry_lock = threading.Lock()
+
+
+def _intern_value(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class CorpusStore:
+    """
+    Read-only sequence of texts stored in one arena.
+
+    Indexing returns a freshly materialised Document.
+    """
+
+    def __init__(self, arena, offsets, metadatas, version=None):
+        self.arena = arena
+        self.offsets = offsets
+        self.version = version
+        self._view = memoryview(arena).cast("B")
+        # intern metadata: identical dicts are kept once and referenced by id
+        self._metadata_table = []
+        self._metadata_ids = array("i")
+        seen = {}
+        for metadata in metadatas:
+            key = tuple(sorted((k, repr(v)) for k, v in metadata.items()))
+            metadata_id = seen.get(key)
+            if metadata_id is None:
+                metadata_id = seen[key] = len(self._metadata_table)
+                self._metadata_table.append({sys.intern(k): _intern_value(v) for k, v in metadata.items()})
+            self._metadata_ids.append(metadata_id)
+
+    @classmethod
+    def from_documents(cls, docs, version=None):
+        offsets = array("q", [0])
+        parts = []
+        for doc in docs:
+            encoded = doc.page_content.encode("utf-8")
+            parts.append(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+        return cls(b"".join(parts), offsets, [doc.metadata for doc in docs], version=version)
+
+    def __len__(self):
+        return len(self._metadata_ids)
+
+    def __getitem__(self, i):
+        return Document(page_content=self.text(i), metadata=self.metadata(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def text(self, i):
+        return str(self._view[int(self.offsets[i]):int(self.offsets[i + 1])], "utf-8")
+
+    def metadata(self, i):
+        return dict(self._metadata_table[self._metadata_ids[i]])
+
+    def metadatas(self):
+        """Shared (not copied) metadata dicts, one per text. Do not modify them."""
+        return [self._metadata_table[metadata_id] for metadata_id in self._metadata_ids]
+
+    @property
+    def nbytes(self):
+        return len(self._view) + self._metadata_ids.itemsize * len(self._metadata_ids) + 8 * len(self.offsets)
+
+
+def _evict_oldest(registry, limit):
+    # dicts keep insertion order, so the first keys are the oldest
+    while len(registry) > limit:
+        registry.pop(next(iter(registry)))
+
+
+def register_corpus(store):
+    with _registry_lock:
+        store = _corpora.setdefault(store.version, store)
+        _evict_oldest(_corpora, MAX_CORPORA)
+        return store
+
+
+def release_corpus(version):
+    """Drop a registered corpus, e.g. once a retriever holds its chunks."""
+    with _registry_lock:
+        _corpora.pop(version, None)
+
+
+def get_corpus(version):
+    """The registered corpus for `version`, or None."""
+    return _corpora.get(version)
+
+
+def directory_signature(data_dir, files):
+    stats = [(path, os.path.getsize(path), os.path.getmtime(path)) for path in sorted(files)]
+    return (os.path.realpath(data_dir), tuple(stats))
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def directory_fingerprint(data_dir="./data"):
+    """
+    Corpus version of a directory: a hash of the relative paths and contents of its files.
+
+    Mtimes and the spelling of `data_dir` do not matter, so a copy of the same
+    files on another node has the same version. Files are hashed, not parsed,
+    and the result is reused until the directory signature changes. Returns
+    None for a directory without supported files.
+    """
+    from data_loader import list_files
+
+    files = list_files(data_dir)
+    if not files:
+        return None
+    signature = directory_signature(data_dir, files)
+    with _registry_lock:
+        version = _signatures.get(signature)
+    if version is None:
+        root = os.path.realpath(data_dir)
+        digest = hashlib.sha256()
+        for relative, path in sorted((os.path.relpath(os.path.realpath(p), root), p) for p in files):
+            digest.update(f"{relative}\0{_file_digest(path)}\n".encode("utf-8"))
+        version = digest.hexdigest()
+        with _registry_lock:
+            _signatures[signature] = version
+            _evict_oldest(_signatures, MAX_SIGNATURES)
+    return version
+
+
+def load_corpus(data_dir="./data"):
+    """
+    Load the documents of a directory into a shared CorpusStore.
+
+    Files are only parsed when no store is registered for the directory's
+    current `directory_fingerprint`; otherwise the registered store is
+    returned as is.
+    """
+    from data_loader import load_files
+
+    version = directory_fingerprint(data_dir)
+    store = get_corpus(version)
+    if store is None:
+        store = register_corpus(CorpusStore.from_documents(load_files(data_dir), version=version))
+    return store
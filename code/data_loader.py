@@ -1,7 +1,13 @@
 import os
+import json
+import hashlib
 import requests
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from pathlib import Path
+from urllib.parse import urlparse
 import streamlit as st
 import pandas as pd
 from pypdf import PdfReader
@@ -12,9 +18,21 @@ from langchain_community.document_loaders.csv_loader import CSVLoader
 from langchain_community.document_loaders import OnlinePDFLoader
 from langchain_community.document_loaders import WebBaseLoader, WikipediaLoader
 
+from doc_store import DocumentStore
+
 # for local files
 CONTENT_DIR = os.path.dirname(__file__)
 
+# for downloads
+DOWNLOAD_TIMEOUT = (5, 60)  # connect, read timeout in seconds
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_CACHE = os.path.join("store", "downloads.json")
+MAX_DOWNLOAD_WORKERS = 4
+
+_session = None
+_session_lock = threading.Lock()
+_cache_lock = threading.Lock()
+
 # Define functions to load different file types
 def load_txt_file(file_path):
     """Load a single text file."""
@@ -53,8 +71,25 @@ def load_online_pdf(pdf_url):
     return data
 
 def filename_from_url(url):
-    filename = url.split("/")[-1]
-    return filename
+    filename = os.path.basename(urlparse(url).path)
+    return filename or "download"
+
+def url_suffixed_filename(filename, url):
+    """`filename` with a short hash of `url` appended to its stem."""
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}{ext}"
+
+def unique_filenames(urls):
+    """Map each URL to a filename, suffixing every basename after the first with a hash of its URL."""
+    filenames = {}
+    taken = set()
+    for url in urls:
+        filename = filename_from_url(url)
+        if filename in taken:
+            filename = url_suffixed_filename(filename, url)
+        taken.add(filename)
+        filenames[url] = filename
+    return filenames
 
 def get_wiki_docs(query, load_max_docs=2):
     wiki_loader = WikipediaLoader(query=query, load_max_docs=load_max_docs)
@@ -68,45 +103,198 @@ def list_files(data_dir="./data", extensions=['.txt', '.csv', '.pdf', '.md']):
         paths.extend(Path(data_dir).rglob(f'*{ext}'))
     return [str(path) for path in paths]
 
-def download_file(url, filename=None):
-    response = requests.get(url)
+def get_session():
+    """Shared HTTP session so repeated downloads reuse pooled connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=MAX_DOWNLOAD_WORKERS,
+                                                    pool_maxsize=MAX_DOWNLOAD_WORKERS,
+                                                    max_retries=2)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+    return _session
+
+def read_download_cache(cache_path=DOWNLOAD_CACHE):
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def update_download_cache(url, entry, cache_path=DOWNLOAD_CACHE):
+    with _cache_lock:
+        cache = read_download_cache(cache_path)
+        cache[url] = entry
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, cache_path)
+
+def file_matches(path, size, sha256):
+    """True if the file at `path` has exactly the given size and sha256."""
+    if size is None or sha256 is None or not os.path.exists(path) or os.path.getsize(path) != size:
+        return False
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest() == sha256
+
+def fetch_file(url, filename=None, data_dir="./data", session=None, cache_path=DOWNLOAD_CACHE,
+               timeout=DOWNLOAD_TIMEOUT):
+    """
+    Download a URL into data_dir, streaming the body to disk.
+
+    A file name already downloaded from another URL gets a suffix derived from
+    this URL. A conditional GET (ETag / Last-Modified from the previous
+    download) is only sent when the file on disk still has the size and hash
+    recorded for this URL, so unchanged files are not fetched again and
+    overwritten ones are.
+
+    Returns:
+        tuple: (download_path, modified) where modified is False if the local copy was up to date.
+    """
     if not filename:
         filename = filename_from_url(url)
+    os.makedirs(data_dir, exist_ok=True)
+    full_path = os.path.realpath(os.path.join(data_dir, filename))
+
+    cache = read_download_cache(cache_path)
+    if full_path in {other.get("path") for other_url, other in cache.items() if other_url != url}:
+        full_path = os.path.realpath(os.path.join(data_dir, url_suffixed_filename(filename, url)))
+
+    headers = {}
+    entry = cache.get(url)
+    if entry and entry.get("path") == full_path and file_matches(full_path, entry.get("size"), entry.get("sha256")):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
 
-    full_path = os.path.join("./data", filename)
+    session = session or get_session()
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            return full_path, False
+        response.raise_for_status()
 
-    with open(full_path, mode="wb") as f:
-        f.write(response.content)
-        download_path = os.path.realpath(f.name)
+        # write to a temporary file first so an interrupted download never replaces a good copy
+        tmp_path = full_path + ".part"
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, mode="wb") as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        update_download_cache(url, {
+            "path": full_path,
+            "size": size,
+            "sha256": digest.hexdigest(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }, cache_path=cache_path)
+    return full_path, True
+
+def download_file(url, filename=None, data_dir="./data"):
+    download_path, _ = fetch_file(url, filename=filename, data_dir=data_dir)
     return download_path
 
+def download_files(urls, data_dir="./data", max_workers=MAX_DOWNLOAD_WORKERS):
+    """
+    Download several URLs concurrently.
+
+    URLs whose basenames collide get a suffix derived from the URL, so they
+    never overwrite each other.
+
+    Returns:
+        dict: url -> (download_path, modified) for every URL that downloaded successfully.
+    """
+    urls = list(dict.fromkeys(urls))
+    filenames = unique_filenames(urls)
+
+    def fetch(url):
+        try:
+            return url, fetch_file(url, filename=filenames[url], data_dir=data_dir)
+        except Exception as e:
+            logging.error(f"Error downloading {url}: {e}")
+            return url, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(fetch, urls)
+    return {url: result for url, result in results if result is not None}
+
+def add_file_metadata(docs, file_path):
+    """Record the source, file type and ingestion date used for retrieval filtering."""
+    file_type = os.path.splitext(file_path)[1].lstrip('.').lower()
+    ingested = date.today().isoformat()
+    for doc in docs:
+        doc.metadata.update({'source': file_path, 'file_type': file_type, 'ingested': ingested})
+    return docs
+
+def load_file(file_path):
+    """Load a single supported file as a list of documents."""
+    if file_path.endswith('.txt'):
+        docs = [load_txt_file(file_path)]
+    elif file_path.endswith('.csv'):
+        docs = [load_csv_file(file_path)]
+    elif file_path.endswith('.pdf'):
+        docs = load_pdf_file(file_path)
+    elif file_path.endswith('.md'):
+        docs = [load_md_file(file_path)]
+    else:
+        logging.warning(f"Unsupported file type: {file_path}")
+        return []
+    return add_file_metadata(docs, file_path)
+
 def load_files(data_dir="./data"):
     """Load all supported files from the given directory."""
     files = list_files(data_dir)
     docs = []
     for file_path in files:
         try:
-            if file_path.endswith('.txt'):
-                docs.append(load_txt_file(file_path))
-            elif file_path.endswith('.csv'):
-                docs.append(load_csv_file(file_path))
-            elif file_path.endswith('.pdf'):
-                docs.extend(load_pdf_file(file_path))
-            elif file_path.endswith('.md'):
-                docs.append(load_md_file(file_path))
-            else:
-                logging.warning(f"Unsupported file type: {file_path}")
+            docs.extend(load_file(file_path))
         except Exception as e:
             logging.error(f"Error processing file {file_path}: {e}")
             pass
     return docs
 
-def get_document_text(uploaded_file, title=None):
-    """Load content from a given file-like object."""
+def store_file(store, file_path):
+    """Extract a file into the document store unless the stored copy is up to date; returns its key."""
+    key = os.path.realpath(file_path)
+    stat = os.stat(file_path)
+    fingerprint = f"{stat.st_size}-{stat.st_mtime_ns}"
+    if not store.is_current(key, fingerprint):
+        store.add(key, load_file(file_path), fingerprint=fingerprint)
+    return key
+
+def get_document_text(uploaded_file, title=None, store=None):
+    """
+    Load content from a given file-like object.
+
+    If a DocumentStore is given, the extracted pages are kept there under
+    "upload:<title>" with a content hash, so the same upload is only parsed
+    once and never replaces a data file of the same name.
+    """
     docs = []
     fname = uploaded_file.name
     if not title:
         title = os.path.basename(fname)
+    if store is not None:
+        key = f"upload:{title}"
+        fingerprint = hashlib.sha1(uploaded_file.getvalue()).hexdigest()
+        if not store.is_current(key, fingerprint):
+            store.add(key, get_document_text(uploaded_file, title=title), fingerprint=fingerprint)
+        return list(store.iter_pages(key))
     if fname.lower().endswith('pdf'):
         pdf_reader = PdfReader(uploaded_file)
         for num, page in enumerate(pdf_reader.pages):
@@ -124,6 +312,10 @@ def get_document_text(uploaded_file, title=None):
 
     return docs
 
+@st.cache_resource
+def get_document_store():
+    return DocumentStore()
+
 def main():
     st.title("File Viewer")
 
@@ -143,27 +335,31 @@ def main():
 
         if selected_file is not None:
             st.write(f"Displaying contents of: {selected_file}")
-            docs = load_files(data_dir)
-            for doc in docs:
-                if doc.metadata['title'] == os.path.basename(selected_file):
-                    if selected_file.endswith('.csv'):
-                        st.dataframe(pd.read_csv(selected_file))
-                    elif selected_file.endswith('.md'):
-                        st.markdown(doc.page_content)
-                    else:
-                        st.text(doc.page_content)
+            if selected_file.endswith('.csv'):
+                st.dataframe(pd.read_csv(selected_file))
+            else:
+                try:
+                    store = get_document_store()
+                    for doc in store.iter_pages(store_file(store, selected_file)):
+                        if selected_file.endswith('.md'):
+                            st.markdown(doc.page_content)
+                        else:
+                            st.text(doc.page_content)
+                except Exception as e:
+                    st.error(f"Error loading file: {e}")
 
         if uploaded_file is not None:
             st.write("Displaying contents of uploaded file:")
             try:
-                docs = get_document_text(uploaded_file)
-                for doc in docs:
-                    if uploaded_file.name.endswith('.csv'):
-                        st.dataframe(pd.read_csv(uploaded_file))
-                    elif uploaded_file.name.endswith('.md'):
-                        st.markdown(doc.page_content)
-                    else:
-                        st.text(doc.page_content)
+                if uploaded_file.name.endswith('.csv'):
+                    st.dataframe(pd.read_csv(uploaded_file))
+                else:
+                    docs = get_document_text(uploaded_file, store=get_document_store())
+                    for doc in docs:
+                        if uploaded_file.name.endswith('.md'):
+                            st.markdown(doc.page_content)
+                        else:
+                            st.text(doc.page_content)
             except Exception as e:
                 st.error(f"Error loading uploaded file: {e}")
 
@@ -175,8 +371,8 @@ def main():
                 if file_type == 'PDF':
                     try:
                         download_path = download_file(url)
-                        docs = load_pdf_file(download_path)
-                        for doc in docs:
+                        store = get_document_store()
+                        for doc in store.iter_pages(store_file(store, download_path)):
                             st.text(doc.page_content)
                     except Exception as e:
                         st.error(f"Error loading PDF: {e}")
@@ -0,0 +1,103 @@
+import json
+import mmap
+import os
+import struct
+import threading
+
+from langchain.docstore.document import Document
+
+DEFAULT_STORE_DIR = os.path.join("store", "pages")
+
+
+class DocumentStore:
+    """
+    Append-only store of extracted page text with O(1) random access.
+
+    Page text is appended to `pages.dat` and every page gets a fixed-size
+    (offset, length) record in `pages.idx`. `catalog.json` maps each source key
+    (a file path, or e.g. "upload:<name>" for uploads) to its first record, a
+    fingerprint of the source and the per-page metadata. Both data files are
+    memory-mapped, so fetching a page is a dict lookup and a slice; nothing
+    else in the corpus is read. Re-adding a key appends a new copy and points
+    the catalog at it.
+    """
+    RECORD = struct.Struct("<QQ")
+
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        os.makedirs(root, exist_ok=True)
+        self.data_path = os.path.join(root, "pages.dat")
+        self.index_path = os.path.join(root, "pages.idx")
+        self.catalog_path = os.path.join(root, "catalog.json")
+        for path in (self.data_path, self.index_path):
+            open(path, "ab").close()
+        try:
+            with open(self.catalog_path, "r", encoding="utf-8") as f:
+                self._catalog = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._catalog = {}
+        self._lock = threading.RLock()
+        self._maps = {}
+
+    def _map(self, path):
+        """Memory map of a data file, remapped after it has grown."""
+        size = os.path.getsize(path)
+        current = self._maps.get(path)
+        if current is None or len(current) != size:
+            if current is not None:
+                current.close()
+            if size == 0:
+                return b""
+            with open(path, "rb") as f:
+                current = self._maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return current
+
+    def _save_catalog(self):
+        tmp_path = self.catalog_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._catalog, f)
+        os.replace(tmp_path, self.catalog_path)
+
+    def add(self, key, docs, fingerprint=None):
+        """Append the pages of a document, replacing any earlier copy stored under `key`."""
+        with self._lock:
+            # drop a partial record left by an interrupted append so records stay aligned
+            first, partial = divmod(os.path.getsize(self.index_path), self.RECORD.size)
+            if partial:
+                os.truncate(self.index_path, first * self.RECORD.size)
+            metadatas = []
+            with open(self.data_path, "ab") as data, open(self.index_path, "ab") as index:
+                offset = data.tell()
+                for doc in docs:
+                    text = doc.page_content.encode("utf-8")
+                    data.write(text)
+                    index.write(self.RECORD.pack(offset, len(text)))
+                    offset += len(text)
+                    metadatas.append(doc.metadata)
+            self._catalog[key] = {"first": first, "fingerprint": fingerprint, "metadata": metadatas}
+            self._save_catalog()
+
+    def is_current(self, key, fingerprint):
+        entry = self._catalog.get(key)
+        return entry is not None and fingerprint is not None and entry["fingerprint"] == fingerprint
+
+    def keys(self):
+        return list(self._catalog)
+
+    def page_count(self, key):
+        return len(self._catalog[key]["metadata"])
+
+    def get_page(self, key, page=1):
+        """Fetch a single page (1-based) of a stored document."""
+        entry = self._catalog[key]
+        if not 1 <= page <= len(entry["metadata"]):
+            raise IndexError(f"{key} has no page {page}")
+        with self._lock:
+            offset, length = self.RECORD.unpack_from(self._map(self.index_path),
+                                                     (entry["first"] + page - 1) * self.RECORD.size)
+            text = self._map(self.data_path)[offset:offset + length].decode("utf-8")
+        return Document(page_content=text, metadata=dict(entry["metadata"][page - 1]))
+
+    def iter_pages(self, key):
+        """Yield the pages of a stored document one at a time."""
+        for page in range(1, self.page_count(key) + 1):
+            yield self.get_page(key, page)
@@ -1,20 +1,65 @@
+import logging
 import os
+import uuid
+from typing import Any, Dict, List, Optional
+
 from dotenv import load_dotenv
-from langchain_community.retrievers import BM25Retriever
 from langchain.retrievers import EnsembleRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.retrievers import BaseRetriever
 from langchain.docstore.document import Document
 
+from corpus_store import CorpusStore
+from metadata_index import MetadataIndex, tag_workflows, to_chroma_where, workflow_filters
+from sparse_index import SparseIndex
 from splitter import split_documents
 from vector_store import create_vector_db
 
-def create_ensemble_retriever(docs, embeddings=None):
+
+class FilteredBM25Retriever(BaseRetriever):
+    """BM25 retriever that masks the postings with metadata filters before scoring."""
+    docs: Any
+    """Sequence of chunks, indexed like the sparse index."""
+    sparse_index: Any
+    metadata_index: Any
+    filters: Optional[Dict[str, Any]] = None
+    k: int = 4
+
+    def _get_relevant_documents(
+            self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        _, mask = self.metadata_index.resolve(self.filters, query, min_candidates=self.k)
+        return [self.docs[i] for i in self.sparse_index.top_k(query, k=self.k, mask=mask)]
+
+
+class FilteredVectorRetriever(BaseRetriever):
+    """Vector store retriever that pushes metadata filters down as a Chroma `where` clause."""
+    vectorstore: Any
+    metadata_index: Any
+    ids: Optional[List[str]] = None
+    """Vector store ids of the chunks added for this retriever, in chunk order."""
+    filters: Optional[Dict[str, Any]] = None
+    k: int = 4
+
+    def _get_relevant_documents(
+            self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        filters, _ = self.metadata_index.resolve(self.filters, query, min_candidates=self.k)
+        return self.vectorstore.similarity_search(query, k=self.k, filter=to_chroma_where(filters))
+
+
+def create_ensemble_retriever(docs, embeddings=None, filters=None, persist_directory=None):
     """
     Create an ensemble retriever from a list of documents.
 
     Args:
         docs (list or Document): List of documents or single document.
         embeddings (optional): Embeddings for vector database (if applicable).
+        filters (dict, optional): Metadata filters applied to both retrievers,
+            e.g. {"title": ["a.pdf", "b.pdf"]} or the result of `workflow_filters`.
+        persist_directory (str, optional): Where Chroma keeps the vectors,
+            defaults to the shared store/chroma collection.
 
     Returns:
         EnsembleRetriever: Ensemble retriever instance.
@@ -22,16 +67,24 @@ def create_ensemble_retriever(docs, embeddings=None):
     # Convert single document to list if needed
     if isinstance(docs, Document):
         docs = [docs]
-    
-    # Split documents into text
-    texts = split_documents(docs)
-    
+
+    # Split documents into text and tag chunks with the workflows they belong to
+    texts = tag_workflows(split_documents(docs))
+    # keep the chunks in one compact arena; Documents are only rebuilt for hits
+    chunks = CorpusStore.from_documents(texts)
+    metadata_index = MetadataIndex(chunks.metadatas())
+
     # Create vector database retriever
-    vector_db = create_vector_db(texts, embeddings)
-    vector_db_retriever = vector_db.as_retriever()
+    ids = [str(uuid.uuid4()) for _ in texts]
+    vector_db = create_vector_db(texts, embeddings, persist_directory=persist_directory, ids=ids)
+    vector_db_retriever = FilteredVectorRetriever(vectorstore=vector_db, metadata_index=metadata_index,
+                                                  ids=ids, filters=filters)
 
-    # Create BM25 retriever
-    bm25_retriever = BM25Retriever.from_texts([doc.page_content for doc in docs])
+    # Create BM25 retriever over the same chunks
+    bm25_retriever = FilteredBM25Retriever(docs=chunks,
+                                           sparse_index=SparseIndex.from_texts([t.page_content for t in texts]),
+                                           metadata_index=metadata_index,
+                                           filters=filters)
 
     # Create ensemble retriever with equal weights
     ensemble_retriever = EnsembleRetriever(
@@ -40,3 +93,47 @@ def create_ensemble_retriever(docs, embeddings=None):
     )
 
     return ensemble_retriever
+
+
+def restrict_retriever(ensemble_retriever, filters):
+    """
+    Return a copy of an ensemble retriever that only searches chunks matching `filters`.
+
+    The underlying indexes are shared, so this is cheap enough to call per workflow.
+    """
+    retrievers = [r.copy(update={"filters": filters}) if hasattr(r, "filters") else r
+                  for r in ensemble_retriever.retrievers]
+    return EnsembleRetriever(retrievers=retrievers, weights=ensemble_retriever.weights)
+
+
+def workflow_coverage(ensemble_retriever, workflow):
+    """
+    How many chunks are tagged for `workflow` and how many a workflow filter needs.
+
+    Returns:
+        tuple: (tagged, required), or None if the workflow or retriever cannot be filtered.
+    """
+    filters = workflow_filters(workflow)
+    filtered = [r for r in ensemble_retriever.retrievers if hasattr(r, "filters")]
+    if not filters or not filtered:
+        return None
+    metadata_index = filtered[0].metadata_index
+    return int(metadata_index.mask(filters).sum()), metadata_index.min_static_candidates(filtered[0].k)
+
+
+def create_workflow_retriever(ensemble_retriever, workflow):
+    """
+    Restrict an ensemble retriever to the chunks tagged with the selected workflow.
+
+    Workflows tagging too small a part of the corpus are not applied (see
+    `MetadataIndex.resolve`); a warning says so.
+    """
+    coverage = workflow_coverage(ensemble_retriever, workflow)
+    if coverage is None:
+        return ensemble_retriever
+    tagged, required = coverage
+    if tagged < required:
+        logging.warning(f"Only {tagged} chunks are tagged for {workflow!r} (need {required}); "
+                        f"searching the whole corpus")
+        return ensemble_retriever
+    return restrict_retriever(ensemble_retriever, workflow_filters(workflow))
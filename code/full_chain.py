@@ -19,9 +19,7 @@ ZEPHYR_ID = "HuggingFaceH4/zephyr-7b-beta"
 # LLAMA_ID = "meta-llama/Meta-Llama-3-8B"
 # ZEPHYR_ID_2 = "HuggingFaceH4/zephyr-orpo-141b-A35b-v0.1"
 
-def create_full_chain(retriever, system_prompt=None, openai_api_key=None, chat_memory=ChatMessageHistory()):
-    if not system_prompt:
-        system_prompt = """You help credit risk officers to evaluate a loan application. Based on the details given to you about a person or a loan application, you suggest giving them loan or not and why you arrived at that conclusion.
+DEFAULT_SYSTEM_PROMPT = """You help credit risk officers to evaluate a loan application. Based on the details given to you about a person or a loan application, you suggest giving them loan or not and why you arrived at that conclusion.
         Use the following context and the users' chat history to help the user:
         If you don't know the answer, just say that you don't know. 
         
@@ -29,16 +27,25 @@ def create_full_chain(retriever, system_prompt=None, openai_api_key=None, chat_m
         
         Question: """
 
-    model = get_model("ChatGPT", openai_api_key=openai_api_key)
+
+def create_answer_chain(retriever, model, system_prompt=None):
+    """RAG chain answering a standalone question, without chat history."""
     prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", system_prompt),
+            ("system", system_prompt or DEFAULT_SYSTEM_PROMPT),
             ("human", "{question}"),
         ]
     )
+    return make_rag_chain(model, retriever, rag_prompt=prompt)
+
+
+def create_full_chain(retriever, system_prompt=None, openai_api_key=None, chat_memory=ChatMessageHistory(),
+                      model=None, get_session_history=None):
+    if model is None:
+        model = get_model("ChatGPT", openai_api_key=openai_api_key)
 
-    rag_chain = make_rag_chain(model, retriever, rag_prompt=prompt)
-    chain = create_memory_chain(model, rag_chain, chat_memory)
+    rag_chain = create_answer_chain(retriever, model, system_prompt=system_prompt)
+    chain = create_memory_chain(model, rag_chain, chat_memory, get_session_history=get_session_history)
     return chain
 
 
@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import (AsyncCallbackManager, AsyncCallbackManagerForLLMRun, CallbackManager,
+                                      CallbackManagerForLLMRun)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, messages_to_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+DEFAULT_TTL = 7 * 24 * 3600  # one week
+DEFAULT_MAX_ENTRIES = 10000
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class CompletionCache:
+    """
+    SQLite-backed cache of chat completions.
+
+    Entries expire after `ttl` seconds; once there are more than `max_entries`
+    the least recently used ones are evicted.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS completions "
+                           "(key TEXT PRIMARY KEY, value TEXT, created REAL, last_used REAL)")
+        self._conn.commit()
+
+    def lookup(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def update(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)", (key, value, now, now))
+            if self.ttl:
+                self._conn.execute("DELETE FROM completions WHERE created < ?", (now - self.ttl,))
+            self._conn.execute("DELETE FROM completions WHERE key IN (SELECT key FROM completions "
+                               "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": round(self.hit_ratio, 3), "entries": entries}
+
+
+def get_completion_cache(path, **kwargs):
+    """One cache (and SQLite connection) per path, shared by every model in the process."""
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = CompletionCache(path, **kwargs)
+        return _caches[path]
+
+
+def _child_callbacks(run_manager):
+    """Callbacks for the wrapped model's run, nested under ours (LLM run managers have no get_child)."""
+    if run_manager is None:
+        return None
+    if isinstance(run_manager, AsyncCallbackManagerForLLMRun):
+        manager = AsyncCallbackManager(handlers=[], parent_run_id=run_manager.run_id)
+    else:
+        manager = CallbackManager(handlers=[], parent_run_id=run_manager.run_id)
+    manager.set_handlers(run_manager.inheritable_handlers)
+    manager.add_tags(run_manager.inheritable_tags)
+    manager.add_metadata(run_manager.inheritable_metadata)
+    return manager
+
+
+class CachedChatModel(BaseChatModel):
+    """
+    Wraps a chat model and answers repeated prompts from a CompletionCache.
+
+    The cache key covers the wrapped model's id and parameters and the exact
+    message list, so only identical calls are reused. Streaming replays a cached
+    answer as a single chunk and caches a streamed answer once it completes.
+    """
+    model: Any
+    """The wrapped chat model."""
+    completion_cache: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.model._llm_type}"
+
+    @property
+    def _identifying_params(self):
+        return self.model._identifying_params
+
+    def _cache_key(self, messages: List[BaseMessage], stop: Optional[List[str]], **kwargs: Any) -> str:
+        payload = {
+            "model": self.model._llm_type,
+            "params": self.model._identifying_params,
+            "messages": messages_to_dict(messages),
+            "stop": stop,
+            "kwargs": kwargs,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _result(content):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        key = self._cache_key(messages, stop, **kwargs)
+        cached = self.completion_cache.lookup(key)
+        if cached is not None:
+            return self._result(cached)
+        message = self.model.invoke(messages, config={"callbacks": _child_callbacks(run_manager)},
+                                    stop=stop, **kwargs)
+        self.completion_cache.update(key, message.content)
+        return self._result(message.content)
+
+    async def _agenerate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        key = self._cache_key(messages, stop, **kwargs)
+        # sqlite calls block, keep them off the event loop
+        cached = await asyncio.to_thread(self.completion_cache.lookup, key)
+        if cached is not None:
+            return self._result(cached)
+        message = await self.model.ainvoke(messages, config={"callbacks": _child_callbacks(run_manager)},
+                                           stop=stop, **kwargs)
+        await asyncio.to_thread(self.completion_cache.update, key, message.content)
+        return self._result(message.content)
+
+    def _stream(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        key = self._cache_key(messages, stop, **kwargs)
+        cached = self.completion_cache.lookup(key)
+        if cached is not None:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=cached))
+            return
+        parts = []
+        for chunk in self.model.stream(messages, config={"callbacks": _child_callbacks(run_manager)}, stop=stop,
+                                       **kwargs):
+            parts.append(chunk.content)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.content)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk.content))
+        self.completion_cache.update(key, "".join(parts))
+
+    async def _astream(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        key = self._cache_key(messages, stop, **kwargs)
+        cached = await asyncio.to_thread(self.completion_cache.lookup, key)
+        if cached is not None:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=cached))
+            return
+        parts = []
+        async for chunk in self.model.astream(messages, config={"callbacks": _child_callbacks(run_manager)},
+                                              stop=stop, **kwargs):
+            parts.append(chunk.content)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.content)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk.content))
+        await asyncio.to_thread(self.completion_cache.update, key, "".join(parts))
+
+
+def with_completion_cache(chat_model, cache_path=None):
+    """
+    Wrap `chat_model` in a CachedChatModel when `cache_path` or the
+    LLM_CACHE_PATH environment variable is set; otherwise return it unchanged.
+    """
+    cache_path = cache_path or os.environ.get("LLM_CACHE_PATH")
+    if not cache_path:
+        return chat_model
+    return CachedChatModel(model=chat_model, completion_cache=get_completion_cache(cache_path))
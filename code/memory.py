@@ -12,7 +12,8 @@ from langchain_core.retrievers import BaseRetriever
 from langchain_core.runnables.history import RunnableWithMessageHistory
 
 
-def create_memory_chain(llm, base_chain, chat_memory):
+def create_contextualize_chain(llm):
+    """Chain that rewrites the latest question into a standalone question using the chat history."""
     contextualize_q_system_prompt = """Given a chat history and the latest user question \
         which might reference context in the chat history, formulate a standalone question \
         which can be understood without the chat history. Do NOT answer the question, \
@@ -25,11 +26,15 @@ def create_memory_chain(llm, base_chain, chat_memory):
             ("human", "{question}"),
         ]
     )
+    return contextualize_q_prompt | llm
 
-    runnable = contextualize_q_prompt | llm | base_chain
 
-    def get_session_history(session_id: str) -> BaseChatMessageHistory:
-        return chat_memory
+def create_memory_chain(llm, base_chain, chat_memory, get_session_history=None):
+    runnable = create_contextualize_chain(llm) | base_chain
+
+    if get_session_history is None:
+        def get_session_history(session_id: str) -> BaseChatMessageHistory:
+            return chat_memory
 
     with_message_history = RunnableWithMessageHistory(
         runnable,
@@ -0,0 +1,153 @@
+import logging
+import re
+from collections import defaultdict
+
+import numpy as np
+
+# Keywords used to tag chunks with the workflows offered in the Streamlit sidebar.
+WORKFLOW_KEYWORDS = {
+    "Credit Card Approval": ["credit card", "card issuer", "cardholder", "credit limit"],
+    "Loan Approval Prediction": ["loan", "probability of default", "borrower", "lending"],
+    "Risk Analysis Dashboard": ["risk weight", "basel", "capital", "exposure at default", "stress test"],
+    "Fraud Detection": ["fraud", "anomal", "suspicious"],
+    "Credit Policy Optimization": ["policy", "covenant", "regulat", "prudential"],
+}
+
+# Metadata keys that are indexed for filtering, in addition to the workflow flags.
+INDEXED_KEYS = ("title", "file_type", "page", "ingested")
+
+# Workflow filters narrower than this share of the corpus are ignored.
+MIN_FILTER_FRACTION = 0.2
+
+
+def workflow_key(workflow):
+    """Metadata key flagging chunks that belong to the given workflow."""
+    slug = re.sub(r"[^a-z0-9]+", "_", workflow.lower()).strip("_")
+    return f"workflow_{slug}"
+
+
+def tag_workflows(docs):
+    """Flag each document with the workflows whose keywords it mentions."""
+    for doc in docs:
+        text = doc.page_content.lower()
+        for workflow, keywords in WORKFLOW_KEYWORDS.items():
+            if any(keyword in text for keyword in keywords):
+                doc.metadata[workflow_key(workflow)] = 1
+    return docs
+
+
+def workflow_filters(workflow):
+    """Filters restricting retrieval to a workflow, or None if the workflow is unknown."""
+    if not workflow:
+        return None
+    key = workflow_key(workflow)
+    if key not in {workflow_key(w) for w in WORKFLOW_KEYWORDS}:
+        return None
+    return {key: 1}
+
+
+def to_chroma_where(filters):
+    """Translate {key: value or [values]} filters into a Chroma `where` clause."""
+    if not filters:
+        return None
+    clauses = []
+    for key, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            values = list(value)
+            if len(values) == 1:
+                clauses.append({key: values[0]})
+            else:
+                clauses.append({"$or": [{key: v} for v in values]})
+        else:
+            clauses.append({key: value})
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+class MetadataIndex:
+    """
+    Attribute index over chunk metadata.
+
+    Keeps one bitmap (numpy bool array) per (key, value) pair so filters can be
+    resolved into a candidate mask without touching the chunk texts.
+    """
+
+    def __init__(self, metadatas):
+        self.size = len(metadatas)
+        self._bitmaps = defaultdict(dict)
+        for i, metadata in enumerate(metadatas):
+            for key, value in metadata.items():
+                if key not in INDEXED_KEYS and not key.startswith("workflow_"):
+                    continue
+                bitmap = self._bitmaps[key].get(value)
+                if bitmap is None:
+                    bitmap = self._bitmaps[key][value] = np.zeros(self.size, dtype=bool)
+                bitmap[i] = True
+
+    @classmethod
+    def from_documents(cls, docs):
+        return cls([doc.metadata for doc in docs])
+
+    def values(self, key):
+        return list(self._bitmaps.get(key, {}))
+
+    def mask(self, filters):
+        """
+        Resolve filters into a bitmap of matching chunks.
+
+        Values in a list are OR-ed together, keys are AND-ed. Returns None when
+        there is nothing to filter on.
+        """
+        if not filters:
+            return None
+        result = np.ones(self.size, dtype=bool)
+        for key, value in filters.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            key_mask = np.zeros(self.size, dtype=bool)
+            for v in values:
+                bitmap = self._bitmaps.get(key, {}).get(v)
+                if bitmap is not None:
+                    key_mask |= bitmap
+            result &= key_mask
+        return result
+
+    def filters_for_query(self, query):
+        """Restrict to source titles explicitly mentioned in the query."""
+        query = query.lower()
+        titles = []
+        for title in self.values("title"):
+            stem = str(title).rsplit(".", 1)[0].lower()
+            if len(stem) > 3 and stem in query:
+                titles.append(title)
+        return {"title": titles} if titles else {}
+
+    def min_static_candidates(self, min_candidates=1):
+        """Chunks a static (workflow) filter has to leave before it is applied."""
+        return max(min_candidates, int(MIN_FILTER_FRACTION * self.size))
+
+    def resolve(self, filters, query=None, min_candidates=1):
+        """
+        Combine static filters with filters inferred from the query.
+
+        A filter set is only applied when it leaves at least `min_candidates`
+        chunks; the static filters (keyword-tagged workflows) must also cover
+        MIN_FILTER_FRACTION of the corpus. Otherwise the next, looser set is
+        tried, ending with no filter at all, so a narrow workflow never starves
+        the chain of context.
+        """
+        query_filters = self.filters_for_query(query) if query else {}
+        min_static = self.min_static_candidates(min_candidates)
+        candidates = []
+        if filters and query_filters:
+            candidates.append(({**filters, **query_filters}, min_candidates))
+        if query_filters:
+            candidates.append((query_filters, min_candidates))
+        if filters:
+            candidates.append((filters, min_static))
+        for candidate, minimum in candidates:
+            mask = self.mask(candidate)
+            if mask.sum() >= minimum:
+                return candidate, mask
+            logging.info(f"Metadata filters {candidate} matched {mask.sum()} chunks, need {minimum}")
+        return None, None
@@ -0,0 +1,295 @@
+"""
+Headless HTTP service for asking questions against one shared retriever.
+
+    python query_server.py serve --snapshot store/index.snap --workers 4
+    python query_server.py serve --data-dir ./data --fake
+    python query_server.py bench --url http://127.0.0.1:8080 --requests 500 --concurrency 50
+
+Endpoints:
+    POST /ask       {"question": ..., "session_id": ..., "workflow": ...} -> {"answer": ..., "standalone_question": ...}
+    POST /retrieve  {"query": ..., "workflow": ...} -> {"documents": [{"page_content": ..., "metadata": ...}]}
+    GET  /health    -> corpus version and load
+
+Identical in-flight requests (same standalone question, workflow and corpus
+version) are coalesced into one computation. Requests beyond the concurrency
+limit queue up to --max-queue and are rejected with 503 after that. With
+--workers > 1 every worker process loads the same snapshot file, so the
+memory-mapped index is shared between them. Chat histories for session_id
+live in the worker that served the request, so multi-turn clients need a
+sticky load balancer or --workers 1.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+
+from aiohttp import web
+from dotenv import load_dotenv
+from langchain.memory import ChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage
+
+from ensemble import create_workflow_retriever
+from full_chain import create_answer_chain
+from llm_cache import CachedChatModel, with_completion_cache
+from memory import create_contextualize_chain
+from vector_store import EMBEDDING_MODEL, create_fake_embeddings
+
+DEFAULT_PORT = 8080
+MAX_SESSIONS = 10000
+
+
+class Overloaded(Exception):
+    pass
+
+
+class RequestCoalescer:
+    """Runs at most one computation per key; concurrent callers with the same key share its result."""
+
+    def __init__(self):
+        self.in_flight = {}
+        self.coalesced = 0
+
+    async def run(self, key, compute):
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield so one caller disconnecting does not cancel the shared computation
+        return await asyncio.shield(task)
+
+
+class ConcurrencyLimiter:
+    """Semaphore with a bounded waiting line, so overload is rejected instead of piling up."""
+
+    def __init__(self, max_concurrency, max_queue):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.limit = max_concurrency + max_queue
+        self.pending = 0
+
+    async def run(self, compute):
+        if self.pending >= self.limit:
+            raise Overloaded()
+        self.pending += 1
+        try:
+            async with self.semaphore:
+                return await compute()
+        finally:
+            self.pending -= 1
+
+
+class QueryService:
+    """Shared retriever and chains behind the HTTP handlers."""
+
+    def __init__(self, retriever, model, corpus_version, max_concurrency=16, max_queue=256):
+        self.retriever = retriever
+        self.model = model
+        self.corpus_version = corpus_version
+        self.contextualize_chain = create_contextualize_chain(model)
+        self.coalescer = RequestCoalescer()
+        self.limiter = ConcurrencyLimiter(max_concurrency, max_queue)
+        self.sessions = {}
+        self._retrievers = {}
+        self._answer_chains = {}
+        self.served = 0
+
+    def get_retriever(self, workflow=None):
+        if workflow not in self._retrievers:
+            self._retrievers[workflow] = create_workflow_retriever(self.retriever, workflow)
+        return self._retrievers[workflow]
+
+    def get_answer_chain(self, workflow=None):
+        if workflow not in self._answer_chains:
+            self._answer_chains[workflow] = create_answer_chain(self.get_retriever(workflow), self.model)
+        return self._answer_chains[workflow]
+
+    def get_session_history(self, session_id):
+        if session_id not in self.sessions:
+            if len(self.sessions) >= MAX_SESSIONS:
+                # drop the oldest session
+                self.sessions.pop(next(iter(self.sessions)))
+            self.sessions[session_id] = ChatMessageHistory()
+        return self.sessions[session_id]
+
+    async def standalone_question(self, question, history):
+        if not history.messages:
+            return question
+        response = await self.limiter.run(lambda: self.contextualize_chain.ainvoke(
+            {"question": question, "chat_history": history.messages}))
+        return response.content
+
+    async def ask(self, question, session_id=None, workflow=None):
+        history = self.get_session_history(session_id) if session_id else ChatMessageHistory()
+        standalone = await self.standalone_question(question, history)
+        chain = self.get_answer_chain(workflow)
+        response = await self.coalescer.run(
+            ("ask", self.corpus_version, workflow, standalone),
+            lambda: self.limiter.run(lambda: chain.ainvoke(standalone)))
+        history.add_messages([HumanMessage(content=question), AIMessage(content=response.content)])
+        self.served += 1
+        return {"answer": response.content, "standalone_question": standalone}
+
+    async def retrieve(self, query, workflow=None):
+        retriever = self.get_retriever(workflow)
+        docs = await self.coalescer.run(
+            ("retrieve", self.corpus_version, workflow, query),
+            lambda: self.limiter.run(lambda: retriever.ainvoke(query)))
+        self.served += 1
+        return {"documents": [{"page_content": d.page_content, "metadata": d.metadata} for d in docs]}
+
+
+async def read_json(request, required_key):
+    try:
+        body = await request.json()
+    except Exception:
+        raise web.HTTPBadRequest(text="Expected a JSON body")
+    if not isinstance(body, dict) or not body.get(required_key):
+        raise web.HTTPBadRequest(text=f"'{required_key}' is required")
+    return body
+
+
+def create_app(service):
+    async def ask(request):
+        body = await read_json(request, "question")
+        return web.json_response(await service.ask(body["question"], session_id=body.get("session_id"),
+                                                   workflow=body.get("workflow")))
+
+    async def retrieve(request):
+        body = await read_json(request, "query")
+        return web.json_response(await service.retrieve(body["query"], workflow=body.get("workflow")))
+
+    async def health(request):
+        status = {
+            "corpus_version": service.corpus_version,
+            "pending": service.limiter.pending,
+            "served": service.served,
+            "coalesced": service.coalescer.coalesced,
+        }
+        if isinstance(service.model, CachedChatModel):
+            status["llm_cache"] = service.model.completion_cache.stats()
+        return web.json_response(status)
+
+    @web.middleware
+    async def overload_middleware(request, handler):
+        try:
+            return await handler(request)
+        except Overloaded:
+            return web.json_response({"error": "overloaded"}, status=503, headers={"Retry-After": "1"})
+
+    app = web.Application(middlewares=[overload_middleware])
+    app.router.add_post("/ask", ask)
+    app.router.add_post("/retrieve", retrieve)
+    app.router.add_get("/health", health)
+    return app
+
+
+def create_service(args):
+    """Load the index (snapshot if given, else built from data_dir) and the model."""
+    persist_directory = None
+    if args.fake:
+        from langchain_community.chat_models.fake import FakeListChatModel
+        embeddings, persist_directory = create_fake_embeddings()
+        model = with_completion_cache(FakeListChatModel(responses=["This is a fake answer."],
+                                                        sleep=args.fake_latency))
+    else:
+        from langchain_openai import OpenAIEmbeddings
+        from basic_chain import get_model
+        embeddings = OpenAIEmbeddings(model=args.embedding_model)
+        model = get_model("ChatGPT")
+
+    if args.snapshot:
+        from snapshot import Snapshot
+        snapshot = Snapshot(args.snapshot)
+        retriever = snapshot.as_retriever(embeddings)
+        corpus_version = snapshot.fingerprint
+    else:
+        from data_loader import load_files
+        from ensemble import create_ensemble_retriever
+        from corpus_store import directory_fingerprint
+        docs = load_files(args.data_dir)
+        retriever = create_ensemble_retriever(docs, embeddings=embeddings, persist_directory=persist_directory)
+        corpus_version = directory_fingerprint(args.data_dir)
+    return QueryService(retriever, model, corpus_version,
+                        max_concurrency=args.max_concurrency, max_queue=args.max_queue)
+
+
+def serve_worker(args):
+    load_dotenv()
+    service = create_service(args)
+    web.run_app(create_app(service), host=args.host, port=args.port, reuse_port=args.workers > 1)
+
+
+def serve(args):
+    if args.workers > 1 and not args.snapshot:
+        logging.warning("Every worker builds its own index; use --snapshot to share one memory-mapped index")
+    if args.workers == 1:
+        serve_worker(args)
+        return
+    workers = [multiprocessing.Process(target=serve_worker, args=(args,)) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+async def run_bench(url, n_requests, concurrency, questions):
+    import aiohttp
+
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(session, i):
+        async with semaphore:
+            start = time.monotonic()
+            async with session.post(f"{url}/ask", json={"question": questions[i % len(questions)]}) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            latencies.append(time.monotonic() - start)
+
+    start = time.monotonic()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(one(session, i) for i in range(n_requests)))
+    elapsed = time.monotonic() - start
+    latencies.sort()
+    print(f"{n_requests} requests in {elapsed:.2f}s ({n_requests / elapsed:.1f} req/s), statuses {statuses}")
+    print(f"latency p50 {latencies[len(latencies) // 2] * 1000:.0f}ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Credit risk question answering service.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="run the HTTP service")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--workers", type=int, default=1, help="worker processes sharing the port")
+    serve_parser.add_argument("--snapshot", help="index snapshot to serve from (see snapshot.py)")
+    serve_parser.add_argument("--data-dir", default="./data", help="documents to index when no snapshot is given")
+    serve_parser.add_argument("--embedding-model", default=EMBEDDING_MODEL)
+    serve_parser.add_argument("--max-concurrency", type=int, default=16, help="chain calls running at once")
+    serve_parser.add_argument("--max-queue", type=int, default=256, help="requests allowed to wait before 503")
+    serve_parser.add_argument("--fake", action="store_true", help="use a fake model and embeddings (no API calls)")
+    serve_parser.add_argument("--fake-latency", type=float, default=0.2, help="seconds the fake model takes")
+
+    bench_parser = subparsers.add_parser("bench", help="send load to a running service")
+    bench_parser.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    bench_parser.add_argument("--requests", type=int, default=200)
+    bench_parser.add_argument("--concurrency", type=int, default=20)
+    bench_parser.add_argument("--distinct", type=int, default=10, help="number of distinct questions to send")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args)
+    else:
+        questions = [f"What is the probability of default for applicant {i}?" for i in range(args.distinct)]
+        asyncio.run(run_bench(args.url, args.requests, args.concurrency, questions))
+
+
+if __name__ == "__main__":
+    main()
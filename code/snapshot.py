@@ -0,0 +1,289 @@
+"""
+Single-file snapshots of the retrieval state.
+
+A snapshot holds everything `create_ensemble_retriever` builds from the raw
+files: chunk texts and metadata, chunk vectors and their norms, the BM25
+postings, a fingerprint of the source files and the id of the embedding model.
+A node that loads a snapshot serves queries without parsing PDFs or embedding
+chunks.
+
+File layout (little endian):
+
+    MAGIC | u32 format version | u64 header length | JSON header | sections
+
+Each section is a raw numpy array aligned to 64 bytes. The header records its
+offset, dtype and shape, so on load the arrays are views over one read-only
+memory map. Several processes loading the same file share the same pages.
+
+    python snapshot.py export --data-dir ./data --output store/index.snap
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.retrievers import EnsembleRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from corpus_store import CorpusStore, directory_fingerprint
+from ensemble import FilteredBM25Retriever
+from metadata_index import MetadataIndex
+from sparse_index import SparseIndex
+
+MAGIC = b"ACRMSNAP"
+FORMAT_VERSION = 2
+ALIGNMENT = 64
+PREAMBLE = struct.Struct("<8sIQ")
+DEFAULT_SNAPSHOT_PATH = os.path.join("store", "index.snap")
+
+
+def embedding_model_id(embeddings):
+    """Best-effort identifier of an embeddings object (unwrapping EmbeddingProxy)."""
+    embeddings = getattr(embeddings, "embedding", embeddings)
+    return getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None) or type(embeddings).__name__
+
+
+def vector_norms(vectors):
+    """Row norms, with 1.0 for all-zero rows so they can be divided by."""
+    norms = np.linalg.norm(vectors, axis=1) if len(vectors) else np.zeros(0, dtype=np.float32)
+    return np.where(norms == 0, 1.0, norms).astype(np.float32)
+
+
+class DenseIndex:
+    """Brute-force cosine similarity over a (memory-mapped) matrix of chunk vectors."""
+
+    def __init__(self, vectors, norms=None):
+        self.vectors = vectors
+        # snapshots store the norms, so loading does not read the whole matrix
+        self.norms = vector_norms(vectors) if norms is None else norms
+
+    def top_k(self, query_vector, k=4, mask=None):
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(self.vectors))
+        if len(candidates) == 0:
+            return []
+        scores = self.vectors[candidates] @ query / self.norms[candidates]
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return candidates[top[np.argsort(-scores[top])]].tolist()
+
+
+class SnapshotVectorRetriever(BaseRetriever):
+    """Vector retriever over snapshot vectors; only the query is embedded."""
+    docs: Any
+    dense_index: Any
+    embeddings: Any
+    metadata_index: Any
+    filters: Optional[Dict[str, Any]] = None
+    k: int = 4
+
+    def _get_relevant_documents(
+            self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        _, mask = self.metadata_index.resolve(self.filters, query, min_candidates=self.k)
+        query_vector = self.embeddings.embed_query(query)
+        return [self.docs[i] for i in self.dense_index.top_k(query_vector, k=self.k, mask=mask)]
+
+
+def _collect_vectors(vector_retriever, n_chunks):
+    """
+    Chunk vectors in chunk order, looked up by the ids this build added.
+
+    The Chroma collection may also hold vectors of earlier builds (possibly
+    from another model), so they are never read by scanning the collection.
+    """
+    if not vector_retriever.ids or len(vector_retriever.ids) != n_chunks:
+        raise ValueError("The vector retriever does not know the ids of its chunks")
+    stored = vector_retriever.vectorstore._collection.get(ids=vector_retriever.ids, include=["embeddings"])
+    by_id = dict(zip(stored["ids"], stored["embeddings"]))
+    missing = [i for i in vector_retriever.ids if i not in by_id]
+    if missing:
+        raise ValueError(f"{len(missing)} chunks have no vector in the vector store")
+    dims = {len(by_id[i]) for i in vector_retriever.ids}
+    if len(dims) > 1:
+        raise ValueError(f"Chunk vectors have mixed dimensions {sorted(dims)}")
+    return np.asarray([by_id[i] for i in vector_retriever.ids], dtype=np.float32)
+
+
+def export_snapshot(ensemble_retriever, path=DEFAULT_SNAPSHOT_PATH, fingerprint=None, embedding_model=None):
+    """
+    Write the state of a retriever built by `create_ensemble_retriever` to one file.
+
+    Returns:
+        dict: The snapshot header.
+    """
+    bm25_retriever, vector_retriever = ensemble_retriever.retrievers
+    chunks = bm25_retriever.docs
+    if not isinstance(chunks, CorpusStore):
+        chunks = CorpusStore.from_documents(chunks)
+    sparse = bm25_retriever.sparse_index
+    vectors = _collect_vectors(vector_retriever, len(chunks))
+    if embedding_model is None:
+        embedding_model = embedding_model_id(vector_retriever.vectorstore._embedding_function)
+
+    arrays = {
+        "text_offsets": np.asarray(chunks.offsets, dtype=np.int64),
+        "text_arena": np.frombuffer(chunks.arena, dtype=np.uint8),
+        "vectors": vectors,
+        "norms": vector_norms(vectors),
+        "indptr": sparse.indptr.astype(np.int64),
+        "doc_ids": sparse.doc_ids.astype(np.int32),
+        "tfs": sparse.tfs.astype(np.float32),
+        "doc_lens": sparse.doc_lens.astype(np.float32),
+    }
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "fingerprint": fingerprint,
+        "embedding_model": embedding_model,
+        "n_chunks": len(chunks),
+        "bm25": {"k1": sparse.k1, "b": sparse.b},
+        "vocab": sorted(sparse.vocab, key=sparse.vocab.get),
+        "metadatas": chunks.metadatas(),
+        "sections": {},
+    }
+    # section offsets are relative to the first aligned byte after the header
+    position = 0
+    for name, array in arrays.items():
+        position = -(-position // ALIGNMENT) * ALIGNMENT
+        header["sections"][name] = {"offset": position, "dtype": array.dtype.str, "shape": list(array.shape)}
+        position += array.nbytes
+    header_bytes = json.dumps(header, default=str).encode("utf-8")
+    data_start = -(-(PREAMBLE.size + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + header["sections"][name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+    return header
+
+
+def _read_preamble(f, path):
+    magic, version, header_len = PREAMBLE.unpack(f.read(PREAMBLE.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not an index snapshot")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version {version}, expected {FORMAT_VERSION}")
+    header = json.loads(f.read(header_len))
+    data_start = -(-(PREAMBLE.size + header_len) // ALIGNMENT) * ALIGNMENT
+    return header, data_start
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        return _read_preamble(f, path)[0]
+
+
+class Snapshot:
+    """A loaded snapshot; all arrays are views over one read-only memory map."""
+
+    def __init__(self, path=DEFAULT_SNAPSHOT_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self.header, data_start = _read_preamble(f, path)
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        arrays = {}
+        for name, section in self.header["sections"].items():
+            shape = tuple(section["shape"])
+            arrays[name] = np.frombuffer(self._mmap, dtype=np.dtype(section["dtype"]), count=int(np.prod(shape)),
+                                         offset=data_start + section["offset"]).reshape(shape)
+
+        self.chunks = CorpusStore(arrays["text_arena"], arrays["text_offsets"], self.header["metadatas"],
+                                  version=self.header["fingerprint"])
+        self.metadata_index = MetadataIndex(self.chunks.metadatas())
+        self.dense_index = DenseIndex(arrays["vectors"], arrays["norms"])
+        vocab = {term: i for i, term in enumerate(self.header["vocab"])}
+        self.sparse_index = SparseIndex(vocab, arrays["indptr"], arrays["doc_ids"], arrays["tfs"],
+                                        arrays["doc_lens"], **self.header["bm25"])
+
+    @property
+    def fingerprint(self):
+        return self.header["fingerprint"]
+
+    def as_retriever(self, embeddings, filters=None, k=4):
+        """Ensemble retriever equivalent to the one the snapshot was exported from."""
+        model = embedding_model_id(embeddings)
+        if model != self.header["embedding_model"]:
+            raise ValueError(f"Snapshot was built with embedding model {self.header['embedding_model']!r}, "
+                             f"got {model!r}")
+        bm25_retriever = FilteredBM25Retriever(docs=self.chunks, sparse_index=self.sparse_index,
+                                               metadata_index=self.metadata_index, filters=filters, k=k)
+        vector_retriever = SnapshotVectorRetriever(docs=self.chunks, dense_index=self.dense_index,
+                                                   embeddings=embeddings, metadata_index=self.metadata_index,
+                                                   filters=filters, k=k)
+        return EnsembleRetriever(retrievers=[bm25_retriever, vector_retriever], weights=[0.5, 0.5])
+
+
+def load_snapshot(path, embeddings, filters=None):
+    return Snapshot(path).as_retriever(embeddings, filters=filters)
+
+
+def load_current_snapshot(path, fingerprint, embeddings):
+    """Retriever from the snapshot at `path` if it matches the corpus fingerprint and embeddings, else None."""
+    if not os.path.exists(path):
+        return None
+    # the header alone decides; only a matching snapshot is mapped and indexed
+    try:
+        header = read_header(path)
+    except ValueError as e:
+        logging.warning(f"Ignoring snapshot {path}: {e}")
+        return None
+    if header["fingerprint"] != fingerprint or header["embedding_model"] != embedding_model_id(embeddings):
+        return None
+    return Snapshot(path).as_retriever(embeddings)
+
+
+def main():
+    from dotenv import load_dotenv
+    from data_loader import load_files
+    from ensemble import create_ensemble_retriever
+    from vector_store import EMBEDDING_MODEL, create_fake_embeddings
+
+    parser = argparse.ArgumentParser(description="Export or inspect an index snapshot.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="build the index from a data directory and write a snapshot")
+    export.add_argument("--data-dir", default="./data")
+    export.add_argument("--output", default=DEFAULT_SNAPSHOT_PATH)
+    export.add_argument("--embedding-model", default=EMBEDDING_MODEL)
+    export.add_argument("--fake", action="store_true", help="use fake embeddings (no API calls)")
+    info = subparsers.add_parser("info", help="print the header of a snapshot")
+    info.add_argument("path", nargs="?", default=DEFAULT_SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "info":
+        header = read_header(args.path)
+        header.pop("metadatas")
+        header["vocab"] = len(header["vocab"])
+        print(json.dumps(header, indent=2))
+        return
+
+    load_dotenv()
+    persist_directory = None
+    if args.fake:
+        embeddings, persist_directory = create_fake_embeddings()
+    else:
+        from langchain_openai import OpenAIEmbeddings
+        embeddings = OpenAIEmbeddings(model=args.embedding_model)
+    docs = load_files(args.data_dir)
+    retriever = create_ensemble_retriever(docs, embeddings=embeddings, persist_directory=persist_directory)
+    header = export_snapshot(retriever, args.output, fingerprint=directory_fingerprint(args.data_dir),
+                             embedding_model=embedding_model_id(embeddings))
+    print(f"Wrote {header['n_chunks']} chunks to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import re
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SparseIndex:
+    """
+    BM25 index stored as compressed postings lists.
+
+    Postings for term `t` live in `doc_ids[indptr[t]:indptr[t + 1]]` with matching
+    term frequencies in `tfs`, so a candidate mask can be applied per term before
+    any scoring happens.
+    """
+
+    def __init__(self, vocab, indptr, doc_ids, tfs, doc_lens, k1=1.5, b=0.75):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+        n_docs = len(doc_lens)
+        self.avgdl = float(doc_lens.mean()) if n_docs else 0.0
+        df = np.diff(indptr).astype(np.float32)
+        self.idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    @classmethod
+    def from_texts(cls, texts, **kwargs):
+        vocab = {}
+        postings = []
+        doc_lens = np.zeros(len(texts), dtype=np.float32)
+        for doc_id, text in enumerate(texts):
+            counts = {}
+            tokens = tokenize(text)
+            doc_lens[doc_id] = len(tokens)
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                term_id = vocab.setdefault(token, len(vocab))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((doc_id, tf))
+
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(p) for p in postings])
+        doc_ids = np.fromiter((d for p in postings for d, _ in p), dtype=np.int32, count=indptr[-1])
+        tfs = np.fromiter((tf for p in postings for _, tf in p), dtype=np.float32, count=indptr[-1])
+        return cls(vocab, indptr, doc_ids, tfs, doc_lens, **kwargs)
+
+    def __len__(self):
+        return len(self.doc_lens)
+
+    def scores(self, query, mask=None):
+        """BM25 scores for every document; documents outside `mask` are never scored."""
+        scores = np.zeros(len(self), dtype=np.float32)
+        for token in set(tokenize(query)):
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            doc_ids = self.doc_ids[start:end]
+            tfs = self.tfs[start:end]
+            if mask is not None:
+                keep = mask[doc_ids]
+                doc_ids, tfs = doc_ids[keep], tfs[keep]
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lens[doc_ids] / self.avgdl)
+            scores[doc_ids] += self.idf[term_id] * tfs * (self.k1 + 1) / (tfs + norm)
+        return scores
+
+    def top_k(self, query, k=4, mask=None):
+        """Indices of the `k` best matching documents, best first."""
+        scores = self.scores(query, mask=mask)
+        if mask is not None:
+            scores[~mask] = -np.inf
+        k = min(k, len(scores) if mask is None else int(mask.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])].tolist()
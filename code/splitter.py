@@ -10,11 +10,11 @@ def split_documents(docs):
         length_function=len,
         is_separator_regex=False)
 
-    contents = docs
     if docs and isinstance(docs[0], Document):
-        contents = [doc.page_content for doc in docs]
-
-    texts = text_splitter.create_documents(contents)
+        # keep title/page/etc. on every chunk so retrieval can filter on it
+        texts = text_splitter.split_documents(docs)
+    else:
+        texts = text_splitter.create_documents(docs)
     n_chunks = len(texts)
     print(f"Split into {n_chunks} chunks")
     return texts
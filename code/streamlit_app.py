@@ -1,10 +1,14 @@
+import logging
 import os
 import streamlit as st
 from langchain_community.chat_message_histories import StreamlitChatMessageHistory
 from langchain_community.embeddings import OpenAIEmbeddings
-from ensemble import create_ensemble_retriever
+from ensemble import create_ensemble_retriever, create_workflow_retriever, workflow_coverage
 from full_chain import create_full_chain, ask_question
+from snapshot import DEFAULT_SNAPSHOT_PATH, load_current_snapshot
+from corpus_store import MAX_CORPORA, directory_fingerprint, load_corpus, release_corpus
 from data_loader import *
+from vector_store import EMBEDDING_MODEL
 from streamlit_option_menu import option_menu
 
 st.set_page_config(page_title="All knowing Credit Risk Manager")
@@ -36,9 +40,14 @@ def show_ui(selected_option, qa, prompt_to_user="How may I help you?"):
         message = {"role": "assistant", "content": response.content}
         st.session_state.messages.append(message)
 
-def get_chain(selected_option, openai_api_key=None, huggingfacehub_api_token=None, ensemble_retriever=None):
+def get_chain(selected_option, openai_api_key=None, huggingfacehub_api_token=None, ensemble_retriever=None,
+              restrict_to_workflow=False):
     system_prompt = get_system_prompt(selected_option)
-    chain = create_full_chain(ensemble_retriever,
+    retriever = ensemble_retriever
+    if restrict_to_workflow:
+        # prefer the part of the corpus tagged for the selected workflow
+        retriever = create_workflow_retriever(ensemble_retriever, selected_option)
+    chain = create_full_chain(retriever,
                               system_prompt=system_prompt,
                               openai_api_key=openai_api_key,
                               chat_memory=StreamlitChatMessageHistory(key="langchain_messages"))
@@ -64,10 +73,32 @@ def save_uploaded_file(uploaded_file):
     with open(file_path, "wb") as f:
         f.write(uploaded_file.getvalue())
 
-@st.cache_resource
-def get_retriever(_docs, openai_api_key=None):
-    embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key, model="text-embedding-ada-002")
-    return create_ensemble_retriever(_docs, embeddings=embeddings)
+def refresh_corpus_version():
+    """
+    Point this session at the version of the files currently in DATA_DIR.
+
+    An older version cannot be rebuilt once the files changed, so a stale
+    session moves to the current one instead of caching it under its old key.
+    """
+    corpus_version = directory_fingerprint(DATA_DIR)
+    st.session_state['corpus_version'] = corpus_version
+    return corpus_version
+
+# one retriever per corpus version, keyed by the version that was actually loaded
+@st.cache_resource(max_entries=MAX_CORPORA)
+def get_retriever(corpus_version, openai_api_key=None):
+    embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key, model=EMBEDDING_MODEL)
+    # start from a prebuilt snapshot when it was built from the same documents
+    retriever = load_current_snapshot(DEFAULT_SNAPSHOT_PATH, corpus_version, embeddings)
+    if retriever is None:
+        # only parse the files when there is no usable snapshot
+        corpus = load_corpus(DATA_DIR)
+        if corpus.version != corpus_version:
+            logging.warning(f"{DATA_DIR} changed while loading corpus {corpus_version}")
+        retriever = create_ensemble_retriever(list(corpus), embeddings=embeddings)
+        # the retriever keeps its own chunk arena; do not hold the pages as well
+        release_corpus(corpus.version)
+    return retriever
 
 def get_system_prompt(selected_option):
     default_prompt = """You help credit risk officers to evaluate a loan application. Based on the details given to you about a person or a loan application, you suggest giving them loan or not and why you arrived at that conclusion.
@@ -112,6 +143,7 @@ def run():
     with st.sidebar:
         selected_option = option_menu("Select", ["Credit Card Approval", "Loan Approval Prediction", "Risk Analysis Dashboard", "Fraud Detection", "Credit Policy Optimization"], 
             icons=['credit-card', 'cash', 'bar-chart', 'bricks', 'gear'], menu_icon="menu",default_index=0)
+        restrict_to_workflow = st.checkbox("Prefer documents about this workflow", value=False)
     
     with st.sidebar:
         selected_mode = st.sidebar.radio("Mode", ["Offline", "Online"])
@@ -129,7 +161,7 @@ def run():
             if uploaded_file is not None:
                 if st.sidebar.button("Upload and Run"):
                     file_path = save_uploaded_file(uploaded_file)
-                    st.session_state['docs'] = load_files(data_dir)
+                    refresh_corpus_version()
                     st.sidebar.success(f"Uploaded and processed file: {uploaded_file.name}")
                     st.rerun()
 
@@ -140,7 +172,7 @@ def run():
                     os.remove(os.path.join(data_dir, selected_file))
                     st.sidebar.success(f"Removed file: {selected_file}")
                     files = os.listdir(data_dir) if os.path.exists(data_dir) else []
-                    st.session_state['docs'] = load_files(data_dir)
+                    refresh_corpus_version()
                     st.rerun()
 
         elif selected_mode == "Online":
@@ -150,10 +182,13 @@ def run():
             if st.sidebar.button("Load"):
                 if url:
                     try:
-                        download_path = download_file(url, file_type)
-                        st.session_state['docs'] = load_files(DATA_DIR)
-                        st.sidebar.success(f"Loaded and processed file from URL: {url}")
-                        st.rerun()
+                        download_path, modified = fetch_file(url, data_dir=DATA_DIR)
+                        if modified:
+                            refresh_corpus_version()
+                            st.sidebar.success(f"Loaded and processed file from URL: {url}")
+                            st.rerun()
+                        else:
+                            st.sidebar.info(f"File from URL is unchanged: {url}")
                     except Exception as e:
                         st.error(f"Error loading file from URL: {e}")
 
@@ -165,16 +200,21 @@ def run():
         st.stop()
     if "selected_option" not in st.session_state:
         st.session_state["selected_option"] = None
-        st.session_state['docs'] = load_files(DATA_DIR)
 
     selected_option = selected_option.lower().capitalize() if selected_option else None
     prompt = f"I want to do a {selected_option} evaluation." if selected_option else "Please select an option."
-    docs = st.session_state.get('docs', [])
+    # sessions only hold the corpus version; the retriever itself is shared by the whole process
+    corpus_version = refresh_corpus_version()
 
     if selected_option:
-        if docs:
-            retriever = get_retriever(docs, openai_api_key=openai_api_key)
-            chain = get_chain(selected_option, openai_api_key=openai_api_key, huggingfacehub_api_token=huggingfacehub_api_token, ensemble_retriever=retriever)
+        if corpus_version:
+            retriever = get_retriever(corpus_version, openai_api_key=openai_api_key)
+            if restrict_to_workflow:
+                coverage = workflow_coverage(retriever, selected_option)
+                if coverage and coverage[0] < coverage[1]:
+                    st.sidebar.info(f"Only {coverage[0]} passages are about {selected_option}, "
+                                    f"so all documents are searched.")
+            chain = get_chain(selected_option, openai_api_key=openai_api_key, huggingfacehub_api_token=huggingfacehub_api_token, ensemble_retriever=retriever, restrict_to_workflow=restrict_to_workflow)
             st.subheader("I can predict about credit risk")
             show_ui(selected_option, chain, prompt)
         else:
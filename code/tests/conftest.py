@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules under test live flat in code/ and import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
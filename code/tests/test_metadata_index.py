@@ -0,0 +1,52 @@
+from metadata_index import MIN_FILTER_FRACTION, MetadataIndex, to_chroma_where, workflow_filters
+
+
+def make_index(n_chunks=100, n_fraud=2, n_loan=30):
+    metadatas = []
+    for i in range(n_chunks):
+        metadata = {"title": "fraud.pdf" if i < n_fraud else "basel.pdf", "page": i}
+        if i < n_fraud:
+            metadata["workflow_fraud_detection"] = 1
+        if n_fraud <= i < n_fraud + n_loan:
+            metadata["workflow_loan_approval_prediction"] = 1
+        metadatas.append(metadata)
+    return MetadataIndex(metadatas)
+
+
+def test_mask_ors_values_and_ands_keys():
+    index = make_index()
+    assert index.mask({"title": ["fraud.pdf", "basel.pdf"]}).sum() == 100
+    assert index.mask({"title": "basel.pdf", "workflow_fraud_detection": 1}).sum() == 0
+
+
+def test_resolve_applies_a_broad_workflow_filter():
+    index = make_index()
+    filters, mask = index.resolve(workflow_filters("Loan Approval Prediction"), "rates", min_candidates=4)
+    assert filters == {"workflow_loan_approval_prediction": 1}
+    assert mask.sum() == 30
+
+
+def test_resolve_drops_a_narrow_workflow_filter():
+    index = make_index()
+    assert 2 < MIN_FILTER_FRACTION * 100
+    assert index.resolve(workflow_filters("Fraud Detection"), "rates", min_candidates=4) == (None, None)
+
+
+def test_resolve_falls_back_from_the_combination_to_the_query_title():
+    index = make_index()
+    # no loan-tagged chunk is in fraud.pdf, so only the title from the query is kept
+    filters, mask = index.resolve(workflow_filters("Loan Approval Prediction"), "what does fraud say", min_candidates=2)
+    assert filters == {"title": ["fraud.pdf"]}
+    assert mask.sum() == 2
+
+
+def test_resolve_needs_k_candidates_for_query_titles():
+    index = make_index()
+    assert index.resolve(None, "what does fraud say", min_candidates=4) == (None, None)
+
+
+def test_to_chroma_where():
+    assert to_chroma_where({"title": ["a", "b"], "page": 1}) == {
+        "$and": [{"$or": [{"title": "a"}, {"title": "b"}]}, {"page": 1}]}
+    assert to_chroma_where({"title": ["a"]}) == {"title": "a"}
+    assert to_chroma_where(None) is None
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain_community.embeddings import FakeEmbeddings
+
+import ensemble
+import snapshot
+from snapshot import Snapshot, export_snapshot, load_current_snapshot, read_header
+
+EMBEDDING_SIZE = 16
+
+
+class InMemoryCollection:
+    """Stands in for a Chroma collection, including a vector left over from an earlier build."""
+
+    def __init__(self, ids, vectors):
+        self.vectors = dict(zip(ids, vectors))
+        self.vectors["stale"] = [0.0] * (EMBEDDING_SIZE * 2)
+
+    def get(self, ids, include):
+        ids = list(reversed(ids))
+        return {"ids": ids, "embeddings": [self.vectors[i] for i in ids]}
+
+
+class InMemoryVectorStore:
+    def __init__(self, texts, embeddings, ids):
+        self._embedding_function = embeddings
+        self._collection = InMemoryCollection(ids, embeddings.embed_documents([t.page_content for t in texts]))
+
+    def similarity_search(self, query, k=4, filter=None):
+        return []
+
+
+@pytest.fixture
+def embeddings():
+    return FakeEmbeddings(size=EMBEDDING_SIZE)
+
+
+@pytest.fixture
+def retriever(monkeypatch, embeddings):
+    monkeypatch.setattr(ensemble, "create_vector_db",
+                        lambda texts, embeddings, persist_directory=None, ids=None:
+                        InMemoryVectorStore(texts, embeddings, ids))
+    docs = [Document(page_content=f"doc {i} loan fraud ünïcode " * (i + 1) * 20,
+                     metadata={"title": f"t{i % 3}.pdf", "page": i}) for i in range(8)]
+    return ensemble.create_ensemble_retriever(docs, embeddings=embeddings)
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, retriever):
+    path = str(tmp_path / "index.snap")
+    export_snapshot(retriever, path, fingerprint="v1")
+    return path
+
+
+def test_round_trip_keeps_chunks_and_vectors(retriever, snapshot_path):
+    bm25_retriever, vector_retriever = retriever.retrievers
+    loaded = Snapshot(snapshot_path)
+    assert len(loaded.chunks) == len(bm25_retriever.docs)
+    for i in range(len(loaded.chunks)):
+        assert loaded.chunks[i].page_content == bm25_retriever.docs[i].page_content
+        assert loaded.chunks[i].metadata == bm25_retriever.docs[i].metadata
+    # only this build's vectors, in chunk order
+    collection = vector_retriever.vectorstore._collection
+    np.testing.assert_allclose(loaded.dense_index.vectors, [collection.vectors[i] for i in vector_retriever.ids])
+    np.testing.assert_allclose(loaded.dense_index.norms, np.linalg.norm(loaded.dense_index.vectors, axis=1),
+                               rtol=1e-5)
+
+
+def test_loaded_arrays_are_views_over_the_file(snapshot_path):
+    loaded = Snapshot(snapshot_path)
+    for array in (loaded.dense_index.vectors, loaded.dense_index.norms, loaded.sparse_index.doc_ids):
+        assert not array.flags.owndata
+        assert not array.flags.writeable
+
+
+def test_bm25_results_match_the_original(retriever, snapshot_path, embeddings):
+    original = retriever.retrievers[0]
+    restored = Snapshot(snapshot_path).as_retriever(embeddings).retrievers[0]
+    for query in ("loan 3", "fraud t1", "ünïcode doc 7"):
+        assert ([d.page_content for d in original.invoke(query)] ==
+                [d.page_content for d in restored.invoke(query)])
+
+
+def test_load_current_snapshot_checks_fingerprint_and_model(snapshot_path, embeddings):
+    assert read_header(snapshot_path)["fingerprint"] == "v1"
+    assert load_current_snapshot(snapshot_path, "v1", embeddings) is not None
+    assert load_current_snapshot(snapshot_path, "v2", embeddings) is None
+    with pytest.raises(ValueError):
+        Snapshot(snapshot_path).as_retriever(object())
+
+
+def test_unsupported_format_version_is_ignored(snapshot_path, embeddings, monkeypatch):
+    monkeypatch.setattr(snapshot, "FORMAT_VERSION", snapshot.FORMAT_VERSION + 1)
+    assert load_current_snapshot(snapshot_path, "v1", embeddings) is None
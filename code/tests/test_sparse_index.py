@@ -0,0 +1,53 @@
+import math
+
+import numpy as np
+
+from sparse_index import SparseIndex, tokenize
+
+TEXTS = [
+    "loan default probability for the borrower",
+    "credit card fraud detection with anomaly scores",
+    "loan loan covenant breach",
+    "basel capital requirements for loan exposure",
+]
+
+
+def reference_bm25(texts, query, k1=1.5, b=0.75):
+    docs = [tokenize(text) for text in texts]
+    avgdl = sum(len(doc) for doc in docs) / len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(term in d for d in docs)
+            if not df:
+                continue
+            idf = math.log1p((len(docs) - df + 0.5) / (df + 0.5))
+            tf = doc.count(term)
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avgdl))
+        scores.append(score)
+    return scores
+
+
+def test_scores_match_reference():
+    index = SparseIndex.from_texts(TEXTS)
+    query = "loan default exposure"
+    np.testing.assert_allclose(index.scores(query), reference_bm25(TEXTS, query), rtol=1e-5)
+
+
+def test_top_k_ranks_best_first():
+    index = SparseIndex.from_texts(TEXTS)
+    assert index.top_k("loan covenant capital", k=3) == [2, 3, 0]
+
+
+def test_mask_restricts_candidates():
+    index = SparseIndex.from_texts(TEXTS)
+    mask = np.array([False, True, False, True])
+    assert index.top_k("loan", k=4, mask=mask) == [3, 1]
+    # masked-out documents are never scored
+    assert index.scores("loan", mask=mask)[[0, 2]].tolist() == [0.0, 0.0]
+
+
+def test_empty_mask_returns_nothing():
+    index = SparseIndex.from_texts(TEXTS)
+    assert index.top_k("loan", k=4, mask=np.zeros(len(TEXTS), dtype=bool)) == []
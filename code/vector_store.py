@@ -1,5 +1,8 @@
+import atexit
 import logging
 import os
+import shutil
+import tempfile
 from typing import List
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
@@ -8,6 +11,8 @@ from dotenv import load_dotenv
 from time import sleep
 
 EMBED_DELAY = 0.02  # 20 milliseconds
+# OpenAI embedding model used by the apps, the snapshot export and the query server
+EMBEDDING_MODEL = "text-embedding-3-small"
 
 
 # This is to get the Streamlit app to use less CPU while embedding documents into Chromadb.
@@ -26,7 +31,7 @@ class EmbeddingProxy:
 
 
 # This happens all at once, not ideal for large datasets.
-def create_vector_db(texts, embeddings=None, collection_name="chroma"):
+def create_vector_db(texts, embeddings=None, collection_name="chroma", persist_directory=None, ids=None):
     if not texts:
         logging.warning("Empty texts passed in to create vector database")
     # Select embeddings
@@ -35,19 +40,38 @@ def create_vector_db(texts, embeddings=None, collection_name="chroma"):
         # from langchain_community.embeddings import HuggingFaceEmbeddings
         # embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
         openai_api_key = os.environ["OPENAI_API_KEY"]
-        embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key, model="text-embedding-3-small")
+        embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key, model=EMBEDDING_MODEL)
 
     proxy_embeddings = EmbeddingProxy(embeddings)
     # Create a vectorstore from documents
     # this will be a chroma collection with a default name.
     db = Chroma(collection_name=collection_name,
                 embedding_function=proxy_embeddings,
-                persist_directory=os.path.join("store/", collection_name))
-    db.add_documents(texts)
+                persist_directory=persist_directory or os.path.join("store/", collection_name))
+    db.add_documents(texts, ids=ids)
 
     return db
 
 
+def temporary_persist_directory():
+    """Throwaway Chroma directory, e.g. for fake embeddings that must not end up in store/."""
+    path = tempfile.mkdtemp(prefix="chroma-")
+    atexit.register(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+
+def create_fake_embeddings(size=256):
+    """
+    Fake embeddings for runs without API calls, with a throwaway persist directory.
+
+    Returns:
+        tuple: (embeddings, persist_directory); pass the directory to
+            `create_vector_db` so fake vectors never reach store/chroma.
+    """
+    from langchain_community.embeddings import FakeEmbeddings
+    return FakeEmbeddings(size=size), temporary_persist_directory()
+
+
 def find_similar(vs, query):
     docs = vs.similarity_search(query)
     return docs